@@ -2,7 +2,9 @@ import os
 from celery import Celery
 import user_app.tasks
 import resume.tasks
+import mptt_blog.tasks
 from celery.schedules import crontab
+from core.settings import BLOG_LIKES_WRITE_BEHIND, BLOG_LIKES_FLUSH_INTERVAL
 
 broker_connection_retry_on_startup = True
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
@@ -37,3 +39,9 @@ def setup_periodic_tasks(sender, **kwargs):
         name='create_visit'
     )
 
+    if BLOG_LIKES_WRITE_BEHIND:
+        sender.add_periodic_task(
+            BLOG_LIKES_FLUSH_INTERVAL,
+            mptt_blog.tasks.flush_likes_task.s(),
+            name='flush_likes'
+        )
@@ -1,45 +1,64 @@
 from datetime import datetime
 
-from core.settings import ALLOWED_HOSTS
+from core.settings import ALLOWED_HOSTS, VISIT_INFO_HEADERS
+from core.redis_client import get_redis
 from resume.models import UniqueIP
-import redis
+from resume.cache import VISIT_INFO_FIELD
+import re
 import json
 
 list_exclude = [ALLOWED_HOSTS[1],]
 list_path = ['send_email', 'feedback', 'todo_session', 'projects', 'project', 'mptt_blog', 'quiz', 'api', 'index']
 
 
+class PathMatcher:
+    """
+    Собирает list_path в регулярные выражения один раз при старте.
+    bucket() возвращает путь для счётчика ('/projects/django', '/todo_session') или None.
+    """
+
+    def __init__(self, paths):
+        names = '|'.join(map(re.escape, paths))
+        # Первые два сегмента пути, если любой из них есть в paths
+        self.path_re = re.compile(rf'^/(?:(?:{names})(?:/[^/]*)?|[^/]*/(?:{names}))(?=/|$)')
+        # Для todo считаем только первый сегмент
+        self.short_path_re = re.compile(rf'^/(?:{names})(?=/|$)')
+
+    def bucket(self, path):
+        match = (self.short_path_re if 'todo' in path else self.path_re).match(path)
+        return match.group() if match else None
+
+
+path_matcher = PathMatcher(list_path)
+
+
 class UniqueIpMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.db2 = get_redis('visits')
 
     def __call__(self, request):
-        num = 3
-        if 'todo' in request.path:
-            num = 2
-        tuple_req = tuple(request.__dict__.items())
-        path_split = request.path.split('/')[:num]
-        get_ip = self.get_client_ip(request)
-        path_l = list(filter(None, path_split))
-        q = set(list_path) & set(path_l)
-        if get_ip and q:
-            _path = '/'.join(request.path.split('/')[:num])
-            if get_ip not in list_exclude:
-                db2 = redis.Redis(host='localhost', port=6379, db=2, decode_responses=True)
-                if not db2.get(get_ip):
-                    to_save = {'path_client': {_path: 1}, "info_client": str(tuple_req)}
-                    db2.set(get_ip, json.dumps(to_save))
-                else:
-                    ip_cache = json.loads(db2.get(get_ip))
-                    path_client = ip_cache.setdefault('path_client', {})
-                    if _path in path_client:
-                        path_client[_path] += 1
-                    else:
-                        path_client[_path] = 1
-                    db2.set(get_ip, json.dumps(ip_cache))
+        _path = path_matcher.bucket(request.path)
+        if _path:
+            get_ip = self.get_client_ip(request)
+            if get_ip and get_ip not in list_exclude:
+                # Счётчики путей - поля hash посетителя, HINCRBY не теряет инкременты
+                pipe = self.db2.pipeline(transaction=False)
+                pipe.hincrby(get_ip, _path, 1)
+                pipe.hexists(get_ip, VISIT_INFO_FIELD)
+                _, has_info = pipe.execute()
+                if not has_info:
+                    self.db2.hsetnx(get_ip, VISIT_INFO_FIELD, self.get_client_info(request))
 
         return self.get_response(request)
 
+    def get_client_info(self, request):
+        # Только заголовки из VISIT_INFO_HEADERS, а не весь request.__dict__
+        return json.dumps(
+            {header: request.META.get(header) for header in VISIT_INFO_HEADERS},
+            ensure_ascii=False
+        )
+
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
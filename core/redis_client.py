@@ -0,0 +1,43 @@
+import threading
+
+import redis
+
+from core.settings import REDIS_HOST, REDIS_PORT, REDIS_DATABASES, REDIS_MAX_CONNECTIONS
+
+# Реестр пулов соединений: один пул на логическую базу в каждом процессе.
+# redis-py сам пересоздаёт пул после fork, поэтому воркеры не делят сокеты.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name):
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = _pools[name] = redis.ConnectionPool(
+                    host=REDIS_HOST,
+                    port=REDIS_PORT,
+                    db=REDIS_DATABASES[name],
+                    max_connections=REDIS_MAX_CONNECTIONS,
+                    decode_responses=True,
+                )
+    return pool
+
+
+def get_redis(name):
+    return redis.Redis(connection_pool=get_pool(name))
+
+
+def connection_stats():
+    # Сокеты процесса по пулам: created не должен расти под нагрузкой
+    return {
+        name: {
+            'db': pool.connection_kwargs['db'],
+            'created': pool._created_connections,
+            'in_use': len(pool._in_use_connections),
+            'available': len(pool._available_connections),
+        }
+        for name, pool in _pools.items()
+    }
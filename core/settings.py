@@ -189,11 +189,43 @@ USER_SESSION_ATHER = 'user_session_ather'
 REDIS_HOST = _REDIS_HOST
 REDIS_PORT = 6379
 REDIS_DB = 1
+
+# Resume cache
+# Инвалидация идёт по save()/delete, поэтому TTL долгий; для отдельной модели: {'project': 60 * 60}
+RESUME_CACHE_TIMEOUT = 60 * 60 * 24
+RESUME_CACHE_TIMEOUTS = {}
+RESUME_CACHE_LOCK_TIMEOUT = 10
+
+# Visits
+REDIS_VISITS_DB = 2
+# База, в которую create_visit_task переносит визиты через SWAPDB перед записью в UniqueIP
+REDIS_VISITS_SNAPSHOT_DB = 3
+VISITS_BATCH_SIZE = 1000
+# Заголовки запроса, которые сохраняются в info_client при первом визите ip
+VISIT_INFO_HEADERS = ['HTTP_USER_AGENT', 'HTTP_ACCEPT_LANGUAGE']
+
+# Blog likes
+# True - like постов пишется в Redis, а в БД переносится flush_likes_task (mptt_blog/likes.py)
+BLOG_LIKES_WRITE_BEHIND = False
+REDIS_LIKES_DB = 4
+BLOG_LIKES_FLUSH_INTERVAL = 10.0
+BLOG_LIKES_FLUSH_BATCH = 100
+
+# Логические базы Redis для core.redis_client.get_redis(name)
+REDIS_BROKER_DB = 0
+REDIS_DATABASES = {
+    'broker': REDIS_BROKER_DB,
+    'cache': REDIS_DB,
+    'visits': REDIS_VISITS_DB,
+    'visits_snapshot': REDIS_VISITS_SNAPSHOT_DB,
+    'likes': REDIS_LIKES_DB,
+}
+REDIS_MAX_CONNECTIONS = 50
 # Celery
 
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_CACHE_BACKEND = 'django-cache'
-CELERY_BROKER_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
+CELERY_BROKER_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_BROKER_DB}"
 
 CACHES = {
     "default": {
@@ -4,6 +4,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as authViews
 from user_app.views import CustomPasswordResetView
+from core.views import redis_connections
 
 ###APPS###
 
@@ -54,3 +55,6 @@ urlpatterns += [
 
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += [
+        path('debug/redis-connections/', redis_connections, name='redis-connections'),
+    ]
@@ -0,0 +1,10 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+
+from core.redis_client import connection_stats
+
+
+@staff_member_required
+def redis_connections(request):
+    # Пулы текущего процесса веб-сервера: created не должен расти под нагрузкой
+    return JsonResponse(connection_stats())
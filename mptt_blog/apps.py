@@ -5,3 +5,6 @@ class MpttBlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mptt_blog'
     verbose_name = 'Блог'
+
+    def ready(self):
+        import mptt_blog.signals
@@ -0,0 +1,106 @@
+import uuid
+
+from django.core.cache import cache
+from django.http import Http404
+from django.urls import reverse
+
+CATEGORY_TREE_VERSION_KEY = 'mptt_blog_category_tree_version'
+CATEGORY_TREE_TIMEOUT = 60 * 60 * 24
+CATEGORY_FIELDS = ('id', 'title', 'url', 'parent_id', 'author_id', 'tree_id', 'lft', 'rght', 'level')
+
+# Снимок дерева в памяти процесса: (токен поколения, CategoryTree)
+_local_tree = (None, None)
+
+
+class CategoryNode:
+    """
+    Категория из снимка дерева, без обращений к БД.
+    Поддерживает то, что нужно шаблонам: pk, title, url, author_id, get_absolute_url.
+    """
+    __slots__ = CATEGORY_FIELDS + ('parent', 'children')
+
+    def __init__(self, row):
+        for field, value in zip(CATEGORY_FIELDS, row):
+            setattr(self, field, value)
+        self.parent = None
+        self.children = []
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_absolute_url(self):
+        return reverse('mptt_blog_urls:category_mptt', kwargs={'slug_cat': self.url})
+
+    def __str__(self):
+        return f'{self.title}'
+
+
+class CategoryTree:
+    def __init__(self, rows):
+        self.by_id = {}
+        self.by_url = {}
+        self.roots = []
+        # Строки отсортированы по (tree_id, lft), поэтому дети идут в порядке MPTT
+        for row in rows:
+            node = CategoryNode(row)
+            self.by_id[node.id] = node
+            self.by_url[node.url] = node
+            if node.parent_id is None:
+                self.roots.append(node)
+            else:
+                node.parent = self.by_id.get(node.parent_id)
+                if node.parent:
+                    node.parent.children.append(node)
+
+    def get(self, url):
+        node = self.by_url.get(url)
+        if node is None:
+            raise Http404('No Category matches the given query.')
+        return node
+
+    def get_by_id(self, category_id):
+        return self.by_id.get(category_id)
+
+    @staticmethod
+    def get_ancestors(node, ascending=False, include_self=False):
+        branch = [node] if include_self else []
+        parent = node.parent
+        while parent:
+            branch.append(parent)
+            parent = parent.parent
+        return branch if ascending else branch[::-1]
+
+    def get_root(self, node):
+        return self.get_ancestors(node, ascending=True, include_self=True)[-1]
+
+
+def get_category_tree():
+    global _local_tree
+    generation = get_category_tree_generation()
+    local_generation, tree = _local_tree
+    if local_generation == generation:
+        return tree
+
+    from .models import Category
+    key = f'mptt_blog_category_tree_v{generation}'
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(Category.objects.order_by('tree_id', 'lft').values_list(*CATEGORY_FIELDS))
+        cache.set(key, rows, CATEGORY_TREE_TIMEOUT)
+    tree = CategoryTree(rows)
+    _local_tree = (generation, tree)
+    return tree
+
+
+def get_category_tree_generation():
+    # Токен случайный: после вытеснения ключа новый токен не совпадёт со старым снимком процесса
+    generation = cache.get(CATEGORY_TREE_VERSION_KEY)
+    if generation is None:
+        cache.add(CATEGORY_TREE_VERSION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(CATEGORY_TREE_VERSION_KEY)
+    return generation
+
+
+def invalidate_category_tree():
+    cache.set(CATEGORY_TREE_VERSION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,167 @@
+"""
+Write-behind лайки постов (BLOG_LIKES_WRITE_BEHIND).
+
+blog_likes:{id}          - set id пользователей, поставивших like (+ SEED_MEMBER, чтобы пустой set существовал)
+blog_likes_pending:{id}  - hash user_id -> '1' / '0', последние переключения, ещё не записанные в БД
+blog_likes_dirty         - set id постов с pending изменениями
+blog_likes_flushing_ids  - set id постов, которые flush забрал из dirty и ещё не записал в БД
+
+flush_likes() (Celery, core/celery.py) переносит pending пачками в m2m likes и like_count.
+Id переезжают из dirty в flushing_ids через SMOVE и удаляются оттуда только после записи в БД,
+поэтому упавший flush дописывается следующим запуском.
+"""
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import Http404
+from redis import ResponseError, WatchError
+
+from core.redis_client import get_redis
+from core.settings import BLOG_LIKES_WRITE_BEHIND, BLOG_LIKES_FLUSH_BATCH
+
+SEED_MEMBER = '0'
+DIRTY_KEY = 'blog_likes_dirty'
+FLUSHING_IDS_KEY = 'blog_likes_flushing_ids'
+FLUSH_LOCK_KEY = 'blog_likes_flush_lock'
+FLUSH_LOCK_TIMEOUT = 60
+
+
+def likes_key(post_id):
+    return f'blog_likes:{post_id}'
+
+
+def pending_key(post_id):
+    return f'blog_likes_pending:{post_id}'
+
+
+def flushing_key(post_id):
+    return f'blog_likes_flushing:{post_id}'
+
+
+def seed_likes(r, post_id):
+    # Заполняем set из БД один раз: RENAMENX не перезапишет set, уже созданный другим воркером
+    from .models import Post
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404('No Post matches the given query.')
+    user_ids = Post.likes.through.objects.filter(post_id=post_id).values_list('user_id', flat=True)
+    tmp_key = f'{likes_key(post_id)}:seed:{uuid.uuid4().hex}'
+    r.sadd(tmp_key, SEED_MEMBER, *user_ids)
+    if not r.renamenx(tmp_key, likes_key(post_id)):
+        r.delete(tmp_key)
+
+
+def toggle_like_buffered(post_id, user):
+    """
+    Переключает like в Redis, БД обновит flush_likes().
+    Возвращает (добавлен ли like, новое количество лайков).
+    """
+    r = get_redis('likes')
+    key = likes_key(post_id)
+    if not r.exists(key):
+        seed_likes(r, post_id)
+
+    # Проверка и запись одним MULTI/EXEC под WATCH: двойной клик того же пользователя
+    # не разведёт set и pending, изменение set между ними перезапускает блок
+    with r.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                added = not pipe.sismember(key, user.id)
+                pipe.multi()
+                if added:
+                    pipe.sadd(key, user.id)
+                else:
+                    pipe.srem(key, user.id)
+                pipe.hset(pending_key(post_id), user.id, '1' if added else '0')
+                pipe.sadd(DIRTY_KEY, post_id)
+                pipe.scard(key)
+                count = pipe.execute()[-1]
+                return added, count - 1
+            except WatchError:
+                continue
+
+
+def apply_like_buffer(posts, user):
+    """
+    Подставляет like_count и is_like из Redis для постов, у которых есть буфер.
+    Посты без буфера оставляют значения из БД.
+    """
+    if not BLOG_LIKES_WRITE_BEHIND or not posts:
+        return posts
+    r = get_redis('likes')
+    pipe = r.pipeline(transaction=False)
+    for post in posts:
+        pipe.scard(likes_key(post.id))
+        if user.is_authenticated:
+            pipe.sismember(likes_key(post.id), user.id)
+    results = iter(pipe.execute())
+    for post in posts:
+        count = next(results)
+        is_like = next(results) if user.is_authenticated else None
+        if count:
+            post.like_count = count - 1
+            if is_like is not None:
+                post.is_like = bool(is_like)
+    return posts
+
+
+def flush_post_likes(r, post_id):
+    from .models import Post
+    through = Post.likes.through
+    pending, flushing = pending_key(post_id), flushing_key(post_id)
+    if r.exists(flushing):
+        # Прошлый flush не завершился: сначала дописываем его, свежие pending - в следующий раз
+        if r.exists(pending):
+            r.sadd(DIRTY_KEY, post_id)
+    else:
+        try:
+            r.rename(pending, flushing)
+        except ResponseError:
+            return False
+
+    ops = r.hgetall(flushing)
+    add = [int(user_id) for user_id, value in ops.items() if value == '1']
+    remove = [int(user_id) for user_id, value in ops.items() if value == '0']
+
+    with transaction.atomic():
+        exists = Post.objects.filter(pk=post_id).exists()
+        if exists:
+            through.objects.filter(post_id=post_id, user_id__in=remove).delete()
+            add = User.objects.filter(id__in=add).values_list('id', flat=True)
+            through.objects.bulk_create(
+                [through(post_id=post_id, user_id=user_id) for user_id in add],
+                ignore_conflicts=True
+            )
+            Post.objects.filter(pk=post_id).update(
+                like_count=through.objects.filter(post_id=post_id).count()
+            )
+    r.delete(flushing)
+    return exists
+
+
+def flush_likes(batch=BLOG_LIKES_FLUSH_BATCH):
+    r = get_redis('likes')
+    # Один flush за раз; lock с TTL, чтобы упавший воркер его не держал
+    if not r.set(FLUSH_LOCK_KEY, 1, nx=True, ex=FLUSH_LOCK_TIMEOUT):
+        return 0
+
+    flushed = 0
+    try:
+        # Сначала id, не дописанные прошлым запуском
+        post_ids = list(r.smembers(FLUSHING_IDS_KEY))
+        for post_id in r.srandmember(DIRTY_KEY, batch) or []:
+            if r.smove(DIRTY_KEY, FLUSHING_IDS_KEY, post_id):
+                post_ids.append(post_id)
+
+        for post_id in dict.fromkeys(post_ids):
+            if flush_post_likes(r, int(post_id)):
+                flushed += 1
+            r.srem(FLUSHING_IDS_KEY, post_id)
+    finally:
+        r.delete(FLUSH_LOCK_KEY)
+    return flushed
+
+
+def delete_like_buffer(post_id):
+    get_redis('likes').delete(likes_key(post_id), pending_key(post_id), flushing_key(post_id))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from mptt_blog.models import Post, CommentsPost
+
+
+class Command(BaseCommand):
+    help = 'Recount comment_count of posts'
+
+    def handle(self, *args, **options):
+        comments = CommentsPost.objects.filter(post_id=OuterRef('pk')).order_by().values('post_id').annotate(
+            count=Count('id')).values('count')
+        updated = Post.objects.update(comment_count=Coalesce(Subquery(comments), 0))
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано постов: {updated}'))
@@ -1,11 +1,14 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
 from mptt.models import MPTTModel, TreeForeignKey
 from django.utils.text import slugify
 from pytils.translit import slugify
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from ckeditor.fields import RichTextField
+from .cache import invalidate_category_tree
 
 YES = 'True'
 NO = 'False'
@@ -35,6 +38,8 @@ class Post(models.Model):
     favourites = models.ManyToManyField(User, related_name='favourite_posts', default=None, blank=True)
     likes = models.ManyToManyField(User, related_name='like_posts', default=None, blank=True)
     like_count = models.BigIntegerField(default='0')
+    # Поддерживается сигналами CommentsPost (mptt_blog/signals.py), пересчёт: manage.py recount_comments
+    comment_count = models.BigIntegerField(default='0')
     is_fav = models.BooleanField(default=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
@@ -45,6 +50,12 @@ class Post(models.Model):
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Лента категории: keyset-пагинация по (created, id)
+        indexes = [
+            models.Index(fields=['category', '-created', '-id'], name='post_category_created_idx'),
+            # Лента ветки категорий (branch_posts_filter): посты по (created, id) с проверкой категории
+            models.Index(fields=['-created', '-id'], name='post_created_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse('mptt_blog_urls:post_detail', kwargs={'slug_cat': self.category.url, 'pk': self.pk})
@@ -56,24 +67,16 @@ def category_author_default(*args, **kwargs):
 
 
 def update_branch_urls(obj, old_url):
-    update_list = []
-    for children in obj.get_descendants(include_self=False):
-        update_list.append(
-            Category(
-                id=children.id,
-                url=build_url(children.url, old_url, obj.url)
-            )
-        )
-    Category.objects.bulk_update(
-        update_list,
-        fields=['url']
+    # Один UPDATE по диапазону tree_id/lft/rght: у потомков заменяется префикс old_url на obj.url
+    Category.objects.filter(
+        tree_id=obj.tree_id,
+        lft__gt=obj.lft,
+        rght__lt=obj.rght
+    ).update(
+        url=Concat(Value(obj.url), Substr('url', len(old_url) + 1), output_field=models.TextField())
     )
 
 
-def build_url(children_url, old_url, obj_url):
-    return children_url.replace(old_url, obj_url, 1)
-
-
 class Category(MPTTModel):
     title = models.CharField(max_length=50, verbose_name='Название')
     parent = TreeForeignKey(
@@ -88,7 +91,7 @@ class Category(MPTTModel):
         default=category_author_default
     )
 
-    url = models.TextField()
+    url = models.TextField(db_index=True)
 
     def save(self, *args, **kwargs):
         update_branch = False
@@ -99,9 +102,11 @@ class Category(MPTTModel):
             update_branch = True
             old_url = self.url
             self.url = self.build_url()
-        super().save(*args, **kwargs)
-        if update_branch:
-            update_branch_urls(self, old_url)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_branch:
+                update_branch_urls(self, old_url)
+        transaction.on_commit(invalidate_category_tree)
 
     def build_url(self):
         title = slugify(self.title)
@@ -139,3 +144,9 @@ class CommentsPost(models.Model):
     updated = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, related_name='like_comment', default=None, blank=True)
     like_count = models.BigIntegerField(default='0')
+
+    class Meta:
+        # Комментарии поста страницами по id (PostDetailView, post_comments)
+        indexes = [
+            models.Index(fields=['post', 'id'], name='comment_post_id_idx'),
+        ]
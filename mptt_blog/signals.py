@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from core.settings import BLOG_LIKES_WRITE_BEHIND
+from .models import Category, Post, CommentsPost
+from .cache import invalidate_category_tree
+from .likes import delete_like_buffer
+
+
+@receiver(post_delete, sender=Category)
+def category_post_delete(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_category_tree)
+
+
+@receiver(node_moved, sender=Category)
+def category_node_moved(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_category_tree)
+
+
+@receiver(post_delete, sender=Post)
+def post_post_delete(sender, instance, **kwargs):
+    if BLOG_LIKES_WRITE_BEHIND:
+        post_id = instance.id
+        transaction.on_commit(lambda: delete_like_buffer(post_id))
+
+
+@receiver(post_save, sender=CommentsPost)
+def comment_post_save(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=CommentsPost)
+def comment_post_delete(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id).update(comment_count=F('comment_count') - 1)
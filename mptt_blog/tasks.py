@@ -0,0 +1,7 @@
+from celery import shared_task
+
+
+@shared_task
+def flush_likes_task():
+    from mptt_blog.likes import flush_likes
+    return flush_likes()
@@ -1 +1,212 @@
-from django.test import TestCase
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import fakeredis
+import redis
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, Client
+from django.urls import reverse
+
+from .cache import get_category_tree
+from .likes import toggle_like_buffered, flush_likes, flushing_key, likes_key, pending_key, seed_likes, DIRTY_KEY, \
+    FLUSHING_IDS_KEY
+from .models import Category, Post
+
+
+class LikeBufferFlushTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        patcher = mock.patch('mptt_blog.likes.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create(username='liker')
+        category = Category.objects.create(title='Python', author=self.user)
+        self.post = Post.objects.create(title='Post', category=category, content='text', author=self.user)
+        self.through = Post.likes.through
+
+    def test_flush_writes_likes(self):
+        toggle_like_buffered(self.post.id, self.user)
+        self.assertEqual(flush_likes(), 1)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertTrue(self.through.objects.filter(post=self.post, user=self.user).exists())
+        self.assertEqual(self.redis.scard(DIRTY_KEY), 0)
+        self.assertEqual(self.redis.scard(FLUSHING_IDS_KEY), 0)
+
+    def test_crashed_flush_is_retried(self):
+        toggle_like_buffered(self.post.id, self.user)
+        with mock.patch.object(self.through.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                flush_likes()
+
+        # Пост больше не в dirty, но остался в flushing_ids вместе со своим hash
+        self.assertEqual(self.redis.scard(DIRTY_KEY), 0)
+        self.assertTrue(self.redis.exists(flushing_key(self.post.id)))
+
+        self.assertEqual(flush_likes(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.through.objects.filter(post=self.post).count(), 1)
+        self.assertFalse(self.redis.exists(flushing_key(self.post.id)))
+        self.assertEqual(self.redis.scard(FLUSHING_IDS_KEY), 0)
+
+    def test_toggle_after_crash_is_flushed_next(self):
+        toggle_like_buffered(self.post.id, self.user)
+        with mock.patch.object(self.through.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                flush_likes()
+        # Unlike после упавшего flush: сначала дописывается старый hash, потом новый
+        toggle_like_buffered(self.post.id, self.user)
+
+        flush_likes()
+        flush_likes()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertFalse(self.through.objects.filter(post=self.post).exists())
+
+
+    def test_interleaved_toggles_of_one_user_stay_consistent(self):
+        seed_likes(self.redis, self.post.id)
+        key = likes_key(self.post.id)
+        second = []
+
+        def interleave(original):
+            # Второй toggle того же пользователя (двойной клик) - сразу после того, как первый прочитал set
+            def execute_command(client, *args, **options):
+                result = original(client, *args, **options)
+                if not second and args[0] in ('SADD', 'SISMEMBER') and args[1] == key:
+                    second.append(None)  # до вызова: вложенный toggle идёт через этот же хук
+                    second[0] = toggle_like_buffered(self.post.id, self.user)
+                return result
+            return execute_command
+
+        with mock.patch.object(redis.Redis, 'execute_command', interleave(redis.Redis.execute_command)), \
+                mock.patch.object(redis.client.Pipeline, 'execute_command',
+                                  interleave(redis.client.Pipeline.execute_command)):
+            first = toggle_like_buffered(self.post.id, self.user)
+
+        # Один like и один unlike в каком-то порядке: set и pending согласованы
+        self.assertEqual(sorted([second[0][0], first[0]]), [False, True])
+        liked = self.redis.sismember(key, self.user.id)
+        self.assertEqual(self.redis.hget(pending_key(self.post.id), self.user.id), '1' if liked else '0')
+
+        flush_likes()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, int(liked))
+        self.assertEqual(self.through.objects.filter(post=self.post).count(), int(liked))
+        self.assertEqual(self.redis.scard(key) - 1, int(liked))
+
+class LikeConcurrencyTests(TransactionTestCase):
+    likers = 100
+    workers = 20
+
+    def setUp(self):
+        # create, а не bulk_create: профиль пользователя создаётся сигналом post_save
+        self.users = [User.objects.create(username=f'liker{i}') for i in range(self.likers)]
+        category = Category.objects.create(title='Python', author=self.users[0])
+        self.post = Post.objects.create(title='Post', category=category, content='text', author=self.users[0])
+        self.through = Post.likes.through
+
+    def like(self, user, post_id):
+        client = Client()
+        client.force_login(user)
+        return client.post(reverse('mptt_blog_urls:like'), {'action': 'post', 'postid': post_id})
+
+    def like_in_parallel(self):
+        clients = []
+        for user in self.users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        # Ограниченный пул: у postgres max_connections=100, по соединению на поток
+        workers = min(self.workers, len(clients))
+        barrier = threading.Barrier(workers)
+
+        def run(share):
+            try:
+                barrier.wait()
+                return [
+                    client.post(reverse('mptt_blog_urls:like'), {'action': 'post', 'postid': self.post.id}).status_code
+                    for client in share
+                ]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            shares = executor.map(run, [clients[i::workers] for i in range(workers)])
+            statuses = [code for share in shares for code in share]
+        self.assertEqual(statuses, [200] * len(clients))
+        self.post.refresh_from_db()
+
+    def test_parallel_likes_and_unlikes_keep_exact_count(self):
+        self.like_in_parallel()
+        self.assertEqual(self.post.like_count, self.likers)
+        self.assertEqual(self.through.objects.filter(post=self.post).count(), self.likers)
+
+        self.like_in_parallel()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertEqual(self.through.objects.filter(post=self.post).count(), 0)
+
+    def test_like_toggles_off(self):
+        response = self.like(self.users[0], self.post.id)
+        self.assertEqual(response.json()['result'], 1)
+        response = self.like(self.users[0], self.post.id)
+        self.assertEqual(response.json()['result'], 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertFalse(self.through.objects.filter(post=self.post).exists())
+
+    def test_like_missing_post(self):
+        response = self.like(self.users[0], self.post.id + 1)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(self.through.objects.exists())
+
+
+class RandomPostViewQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reader')
+        # Ветка глубиной 4: крошки строятся из кешированного дерева, число запросов от глубины не зависит
+        parent = None
+        for depth in range(4):
+            parent = Category.objects.create(title=f'Level {depth}', author=cls.user, parent=parent)
+            for i in range(3):
+                Post.objects.create(title=f'Post {depth}.{i}', category=parent, content='text', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('mptt_blog_urls:category-list')
+        # Прогрев дерева категорий в кеше
+        self.client.get(self.url)
+
+    def test_anonymous_query_count(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.context['posts']), 8)
+
+    def test_authenticated_query_count(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        with self.assertNumQueries(7):
+            response = self.client.get(self.url)
+        posts = response.context['posts']
+        self.assertEqual(len(posts), 8)
+        self.assertTrue(all(len(p.links) == p.category.level + 1 for p in posts))
+
+
+class CategoryTreeCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Python', author=User.objects.create(username='author'))
+
+    def test_evicted_version_rebuilds_local_tree(self):
+        self.assertEqual(get_category_tree().get_by_id(self.category.id).title, 'Python')
+        # Изменение без сигнала и вытеснение ключа версии: снимок процесса не должен пережить новый токен
+        Category.objects.filter(pk=self.category.pk).update(title='Django')
+        cache.clear()
+        self.assertEqual(get_category_tree().get_by_id(self.category.id).title, 'Django')
@@ -17,6 +17,7 @@ urlpatterns = [
     path('<int:pk>/update', CategoryUpdateView.as_view(), name='category_update'),
     path('<int:pk>/del', CategoryDeleteView.as_view(), name='category_delete'),
     path('<path:slug_cat>/<int:pk>', PostDetailView.as_view(), name='post_detail'),
+    path('<path:slug_cat>/<int:pk>/comments', views.post_comments, name='post_comments'),
     path('<path:slug_cat_create_post>/create_post', PostCreateView.as_view(), name='post_create'),
     path('<path:slug_cat>/<int:pk>/update', PostUpdateView.as_view(), name='post_update'),
     path('<path:slug_cat>/<int:pk>/del', PostDeleteView.as_view(), name='post_del'),
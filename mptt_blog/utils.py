@@ -1,9 +1,195 @@
-
+import base64
 import random
+from datetime import datetime
+
+from django.db import transaction, IntegrityError
+from django.db.models import Min, Max, F, Value, Q, Count
+from django.http import Http404
+
+RANDOM_POSTS_COUNT = 8
+RANDOM_POSTS_ATTEMPTS = 4
+
+
+def random_posts(posts, random_count=RANDOM_POSTS_COUNT):
+    """
+    Случайные id постов из posts без загрузки всех строк.
+    Берём случайные id в диапазоне [min id, max id] и проверяем их одним запросом по pk,
+    при пропусках в id повторяем несколько раз.
+    """
+    bounds = posts.aggregate(min_id=Min('id'), max_id=Max('id'))
+    if bounds['min_id'] is None:
+        return []
+    id_range = range(bounds['min_id'], bounds['max_id'] + 1)
+
+    found = set()
+    for _ in range(RANDOM_POSTS_ATTEMPTS):
+        need = random_count - len(found)
+        candidates = random.sample(id_range, min(len(id_range), need * 3))
+        found.update(posts.filter(pk__in=candidates).values_list('id', flat=True))
+        if len(found) >= random_count or len(candidates) == len(id_range):
+            break
+
+    if len(found) < random_count:
+        # Редкие id в большом диапазоне: добираем недостающие случайной выборкой
+        found.update(
+            posts.exclude(pk__in=found).order_by('?').values_list('id', flat=True)[:random_count - len(found)]
+        )
+    return random.sample(list(found), min(random_count, len(found)))
+
+
+def get_breadcrumbs(categories):
+    """
+    Хлебные крошки для категорий из снимка дерева, без запросов к БД.
+    Возвращает {url категории: [[title, url], ...]} от корня до самой категории.
+    """
+    from .cache import get_category_tree
+
+    tree = get_category_tree()
+    breadcrumbs = {}
+    for category in categories:
+        node = tree.get_by_id(category.id)
+        branch = tree.get_ancestors(node, include_self=True) if node else []
+        breadcrumbs[category.url] = [[n.title, n.url] for n in branch]
+    return breadcrumbs
+
+
+def toggle_m2m(model, obj_id, field_name, user, count_field=None):
+    """
+    Переключает связь user <-> объект в m2m field_name без загрузки объекта и без save().
+    Счётчик count_field меняется через F(), поэтому параллельные запросы не теряют обновления.
+    Возвращает (добавлена ли связь, новое значение счётчика или None).
+    """
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    lookup = {f'{field.m2m_field_name()}_id': obj_id, f'{field.m2m_reverse_field_name()}_id': user.id}
+
+    with transaction.atomic():
+        deleted, _ = through.objects.filter(**lookup).delete()
+        added = not deleted
+        delta = -1 if deleted else 1
+        if added:
+            try:
+                with transaction.atomic():
+                    through.objects.create(**lookup)
+            except IntegrityError:
+                # Параллельный запрос того же пользователя уже добавил связь
+                delta = 0
+
+        objects = model.objects.filter(pk=obj_id)
+        if count_field:
+            updated = objects.update(**{count_field: F(count_field) + delta})
+        else:
+            updated = objects.exists()
+        if not updated:
+            raise Http404(f'No {model._meta.object_name} matches the given query.')
+
+    count = objects.values_list(count_field, flat=True).first() if count_field else None
+    return added, count
+
+
+def mark_user_interactions(posts, user, fields=(('likes', 'is_like'), ('favourites', 'is_favour'))):
+    """
+    Проставляет постам страницы флаги is_like / is_favour текущего пользователя.
+    Все m2m из fields читаются одним запросом (UNION по through-таблицам) для id страницы,
+    вместо запроса на каждое поле или Exists на каждую строку.
+    """
+    posts = list(posts)
+    if not user.is_authenticated or not posts:
+        return posts
+    model = type(posts[0])
+    post_ids = [post.id for post in posts]
+
+    queries = []
+    for field_name, attr in fields:
+        field = model._meta.get_field(field_name)
+        obj_id = f'{field.m2m_field_name()}_id'
+        queries.append(
+            field.remote_field.through.objects.filter(
+                **{f'{obj_id}__in': post_ids, f'{field.m2m_reverse_field_name()}_id': user.id}
+            ).annotate(attr=Value(attr)).values_list(obj_id, 'attr')
+        )
+
+    marked = set(queries[0].union(*queries[1:], all=True))
+    for post in posts:
+        for _, attr in fields:
+            setattr(post, attr, (post.id, attr) in marked)
+    return posts
+
+
+def mark_m2m_counts(posts, fields=(('favourites', 'favourites_count'),)):
+    """
+    Проставляет постам страницы количество связей m2m (например, сколько раз пост в избранном)
+    одним запросом с GROUP BY по id страницы, без загрузки списков пользователей.
+    """
+    posts = list(posts)
+    if not posts:
+        return posts
+    model = type(posts[0])
+    post_ids = [post.id for post in posts]
+    for field_name, attr in fields:
+        field = model._meta.get_field(field_name)
+        obj_id = f'{field.m2m_field_name()}_id'
+        counts = dict(
+            field.remote_field.through.objects.filter(**{f'{obj_id}__in': post_ids}).order_by().values(
+                obj_id).annotate(count=Count('*')).values_list(obj_id, 'count')
+        )
+        for post in posts:
+            setattr(post, attr, counts.get(post.id, 0))
+    return posts
+
+
+KEYSET_ORDERING = ('-created', '-id')
+
+
+def encode_cursor(post):
+    position = f'{post.created.isoformat()}|{post.id}'
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    # ValueError, если курсор не наш
+    created, post_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created), int(post_id)
+
+
+class KeysetPage:
+    """
+    Страница keyset-пагинации: без COUNT(*) и OFFSET, следующая страница начинается после последнего поста.
+    """
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_page(posts, cursor, page_size):
+    """
+    Страница постов по (created, id) от новых к старым, начиная после cursor (пустой cursor - первая страница).
+    Берём page_size + 1 строку, чтобы узнать, есть ли следующая страница.
+    """
+    posts = posts.order_by(*KEYSET_ORDERING)
+    if cursor:
+        created, post_id = decode_cursor(cursor)
+        posts = posts.filter(Q(created__lt=created) | Q(created=created, id__lt=post_id))
+    rows = list(posts[:page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return KeysetPage(rows[:page_size], next_cursor)
 
 
-def random_posts(posts):
-    random_count = 8
-    if len(posts) < random_count:
-        random_count = len(posts)
-    return random.sample(list(posts), random_count)
+def branch_posts_filter(tree_id, lft, rght):
+    """
+    Посты категории и всех её потомков: потомки лежат в диапазоне lft узла внутри tree_id,
+    поэтому фильтр идёт по индексу (tree_id, lft), который создаёт MPTT.
+    Значения могут быть и выражениями (Subquery), тогда узел не загружается отдельным запросом.
+    """
+    return Q(category__tree_id=tree_id, category__lft__range=(lft, rght))
@@ -1,6 +1,7 @@
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect, JsonResponse
+from django.http import HttpResponseRedirect, JsonResponse, Http404
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
 from django.views.generic.edit import FormMixin
 from mptt.querysets import TreeQuerySet
@@ -9,15 +10,36 @@ from mptt.templatetags.mptt_tags import cache_tree_children
 from .models import Category, Post, CommentsPost
 from .forms import CategoryCreateForm, PostCreateForm, CategoryUpdateForm, PostUpdateForm, CommentsPostForm
 from django.urls import reverse
-from django.db.models import Q, OuterRef, Exists, Subquery
+from django.utils.functional import cached_property
+from django.db.models import Q
 from rules.contrib.views import PermissionRequiredMixin
 
-from .utils import random_posts
+from .utils import random_posts, get_breadcrumbs, toggle_m2m, mark_user_interactions, keyset_page, KEYSET_ORDERING, \
+    KeysetPage, branch_posts_filter
+from .cache import get_category_tree
+from .likes import toggle_like_buffered, apply_like_buffer
+from core.settings import BLOG_LIKES_WRITE_BEHIND
 
 like_text = 'Понравилась'
 UnLike_text = 'Поставить Like'
 fav_false_text = 'Нет в избранных'
 fav_true_text = 'В избранных'
+COMMENTS_PAGE_SIZE = 20
+
+
+class CategoryTreeMixin:
+    """
+    Категория из url разрешается один раз за запрос: снимок дерева и узел кэшируются на экземпляре view.
+    """
+    category_url_kwarg = 'slug_cat'
+
+    @cached_property
+    def category_tree(self):
+        return get_category_tree()
+
+    @cached_property
+    def category(self):
+        return self.category_tree.get(self.kwargs[self.category_url_kwarg])
 
 
 class RandomPostView(ListView):
@@ -29,26 +51,18 @@ class RandomPostView(ListView):
         post_qs = Post.objects.select_related('author').select_related('category').all().order_by('-created')
         if self.request.user.is_authenticated:
             # Получаем id постов которые публичные или юзер автор
-            r_posts = random_posts(
-                Post.objects.filter(
-                    Q(is_privat=False) | Q(author=self.request.user)
-                ).values_list('id', flat=True)
-            )
+            r_posts = random_posts(Post.objects.filter(Q(is_privat=False) | Q(author=self.request.user)))
 
-            post_qs = post_qs.filter(pk__in=r_posts).annotate(
-                is_favour=Exists(Post.objects.filter(pk=OuterRef('pk'), favourites=self.request.user)),
-                is_like=Exists(Post.objects.filter(pk=OuterRef('pk'), likes=self.request.user)),
-            )
+            post_qs = post_qs.filter(pk__in=r_posts)
 
         else:
-            post_qs = random_posts(post_qs.filter(is_privat=False))
+            post_qs = post_qs.filter(pk__in=random_posts(Post.objects.filter(is_privat=False)))
 
+        post_qs = mark_user_interactions(post_qs, self.request.user)
+        apply_like_buffer(post_qs, self.request.user)
+        breadcrumbs = get_breadcrumbs(p.category for p in post_qs)
         for p in post_qs:
-            branch = p.category.get_ancestors(
-                ascending=True,
-                include_self=True
-            )
-            p.links = [[p.title, p.url] for p in branch.reverse()]
+            p.links = breadcrumbs[p.category.url]
 
         context['posts'] = post_qs
         context['like_text'] = like_text
@@ -59,43 +73,62 @@ class RandomPostView(ListView):
         return context
 
 
-class CategoryMPTTView(ListView):
+class CategoryMPTTView(CategoryTreeMixin, ListView):
     model = Category
     template_name = "mptt_blog/category/category_mptt.html"
     queryset = None
     context_object_name = 'posts'
     paginate_by = 8
+    # ?cursor= включает keyset-пагинацию вместо ?page=
+    cursor_kwarg = 'cursor'
+    # ?branch=1 - статьи категории и всех её потомков, всегда keyset
+    branch_kwarg = 'branch'
+
+    @cached_property
+    def is_branch(self):
+        return self.branch_kwarg in self.request.GET
+
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        if cursor is None and self.is_branch:
+            cursor = ''
+        if cursor is None:
+            return super().paginate_queryset(queryset, page_size)
+        try:
+            page = keyset_page(queryset, cursor, page_size)
+        except ValueError:
+            raise Http404('Invalid cursor')
+        return None, page, page.object_list, page.has_next
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        category = get_object_or_404(Category.objects.select_related('author'), url=self.kwargs['slug_cat'])
-        cats = category.get_children()
-        parents = category.get_ancestors(ascending=False, include_self=True)
-        context['cats'] = cats
-        context['parents'] = parents
+        tree = self.category_tree
+        category = self.category
+        context['cats'] = category.children
+        context['parents'] = tree.get_ancestors(category, include_self=True)
         context['category'] = category
-        context['root'] = category.get_root()
+        context['root'] = tree.get_root(category)
+        context['branch'] = self.is_branch
         context['like_text'] = like_text
         context['UnLike_text'] = UnLike_text
         context['fav_false_text'] = fav_false_text
         context['fav_true_text'] = fav_true_text
-        if self.request.user.is_authenticated:
-
-            post_ids = {x.id: i for i, x in enumerate(context['page_obj'].object_list)}
-
-            for post_id in self.request.user.favourite_posts.filter(
-                    id__in=list(post_ids.keys())).values_list('id', flat=True):
-                context['page_obj'].object_list[post_ids[post_id]].is_favour = True
-
-            for post_id in self.request.user.like_posts.filter(
-                    id__in=list(post_ids.keys())).values_list('id', flat=True):
-                context['page_obj'].object_list[post_ids[post_id]].is_like = True
-
+        page = context['page_obj']
+        page.object_list = mark_user_interactions(page.object_list, self.request.user)
+        apply_like_buffer(page.object_list, self.request.user)
+        for post in page.object_list:
+            # В ленте ветки пост может лежать в подкатегории, url берём из дерева без запросов
+            post.category_url = tree.get_by_id(post.category_id).url
+        context['posts'] = page.object_list
         return context
 
     def get_queryset(self):
-        category = get_object_or_404(Category, url=self.kwargs['slug_cat'])
-        post_qs = Post.objects.select_related('author').filter(Q(category=category))
+        post_qs = Post.objects.select_related('author')
+        if self.is_branch:
+            category = self.category
+            post_qs = post_qs.filter(branch_posts_filter(category.tree_id, category.lft, category.rght))
+        else:
+            post_qs = post_qs.filter(Q(category_id=self.category.id))
 
         if self.request.user.is_authenticated:
             post_qs = post_qs.filter(
@@ -104,10 +137,10 @@ class CategoryMPTTView(ListView):
 
         else:
             post_qs = post_qs.filter(is_privat=False)
-        return post_qs
+        return post_qs.order_by(*KEYSET_ORDERING)
 
 
-class CategoryCreateView(PermissionRequiredMixin, CreateView):
+class CategoryCreateView(CategoryTreeMixin, PermissionRequiredMixin, CreateView):
     model = Category
     template_name = 'mptt_blog/category/create_topic.html'
     form_class = CategoryCreateForm
@@ -117,7 +150,7 @@ class CategoryCreateView(PermissionRequiredMixin, CreateView):
         context = super(CategoryCreateView, self).get_context_data(**kwargs)
         category = None
         if self.kwargs:
-            category = get_object_or_404(Category, url=self.kwargs['slug_cat'])
+            category = self.category
             context['title'] = 'Создать тему в '
         else:
             context['title'] = 'Создать категорию'
@@ -162,20 +195,24 @@ class PostDetailView(PermissionRequiredMixin, DetailView, FormMixin):
 
     def get_context_data(self, **kwargs):
         context = super(PostDetailView, self).get_context_data(**kwargs)
-        if self.request.user.is_authenticated:
-            context['comments'] = self.object.comments.select_related('author').all().annotate(
-                is_likes=Exists(CommentsPost.objects.filter(pk=OuterRef('pk'), likes=self.request.user)))
+        context['comments'] = comments_page(self.object.id, self.request.user)
 
         context['favourite_flag'] = self.object.favourites.filter(id=self.request.user.id).exists()
-        context['like_flag'] = self.object.likes.filter(id=self.request.user.id).exists()
+        self.object.is_like = self.object.likes.filter(id=self.request.user.id).exists()
+        apply_like_buffer([self.object], self.request.user)
+        context['like_flag'] = self.object.is_like
         context['like_text'] = like_text
         context['UnLike_text'] = UnLike_text
 
         return context
 
-    def get_object(self):
-        post = Post.objects.select_related('author').get(pk=self.kwargs['pk'])
-        return post
+    @cached_property
+    def post_object(self):
+        # Один запрос на пост: get_object вызывают и rules (проверка прав), и get()/post()
+        return get_object_or_404(Post.objects.select_related('author', 'category'), pk=self.kwargs['pk'])
+
+    def get_object(self, queryset=None):
+        return self.post_object
 
     def post(self, request, *args, **kwargs):
         form = self.get_form()
@@ -186,7 +223,7 @@ class PostDetailView(PermissionRequiredMixin, DetailView, FormMixin):
                 CommentsPost(
                     text=form.cleaned_data.get('text'),
                     author=self.request.user,
-                    post=self.get_object()
+                    post=self.object
                 ).save()
 
                 return redirect(request.META.get('HTTP_REFERER'))
@@ -196,18 +233,51 @@ class PostDetailView(PermissionRequiredMixin, DetailView, FormMixin):
     # return render(self.request, 'mptt_blog/post/post_detail.html', context=self.get_context_data())
 
 
-class PostCreateView(PermissionRequiredMixin, CreateView):
+def comments_page(post_id, user, after=None, page_size=COMMENTS_PAGE_SIZE):
+    """
+    Страница комментариев поста по id (старые сначала), начиная после комментария after.
+    """
+    comments = CommentsPost.objects.select_related('author').filter(post_id=post_id).order_by('id')
+    if after:
+        comments = comments.filter(id__gt=after)
+    comments = list(comments[:page_size + 1])
+    next_cursor = comments[page_size - 1].id if len(comments) > page_size else None
+    comments = mark_user_interactions(comments[:page_size], user, (('likes', 'is_likes'),))
+    return KeysetPage(comments, next_cursor)
+
+
+def post_comments(request, *args, **kwargs):
+    post = get_object_or_404(Post.objects.select_related('author', 'category'), pk=kwargs['pk'])
+    if not request.user.has_perm('is_odj_private', post):
+        raise Http404('No Post matches the given query.')
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        raise Http404('Invalid cursor')
+
+    comments = comments_page(post.id, request.user, after)
+    html = render_to_string('mptt_blog/post/comments.html', {
+        'object': post,
+        'comments': comments,
+        'like_text': like_text,
+        'UnLike_text': UnLike_text,
+    }, request=request)
+    return JsonResponse({'html': html, 'next': comments.next_cursor})
+
+
+class PostCreateView(CategoryTreeMixin, PermissionRequiredMixin, CreateView):
     model = Post
     template_name = 'mptt_blog/post/post_create_update.html'
     form_class = PostCreateForm
     permission_required = ('is_user_authenticated',)
+    category_url_kwarg = 'slug_cat_create_post'
 
     def form_valid(self, form):
         form.instance.author = self.request.user
         return super().form_valid(form)
 
     def get_context_data(self, **kwargs):
-        category = get_object_or_404(Category, url=self.kwargs['slug_cat_create_post'])
+        category = self.category
         context = super(PostCreateView, self).get_context_data(**kwargs)
         context['btn'] = 'Добавить'
         context['title'] = 'Создать сталью'
@@ -234,7 +304,8 @@ class PostDeleteView(PermissionRequiredMixin, DeleteView):
     permission_required = ('is_author',)
 
     def get_success_url(self):
-        return reverse('mptt_blog_urls:category_mptt', kwargs={'slug_cat': self.object.category.url})
+        category = get_category_tree().get_by_id(self.object.category_id)
+        return reverse('mptt_blog_urls:category_mptt', kwargs={'slug_cat': category.url})
 
 
 def comment_post_delete(request, *args, **kwargs):
@@ -247,11 +318,7 @@ def comment_post_delete(request, *args, **kwargs):
 
 @login_required
 def favourites_add_rem(request, *args, **kwargs):
-    post = get_object_or_404(Post, pk=kwargs['pk_post_fav'])
-    if post.favourites.filter(id=request.user.id).exists():
-        post.favourites.remove(request.user)
-    else:
-        post.favourites.add(request.user)
+    toggle_m2m(Post, kwargs['pk_post_fav'], 'favourites', request.user)
     return HttpResponseRedirect(
         reverse('mptt_blog_urls:post_detail', kwargs={'slug_cat': kwargs['slug_cat'], 'pk': kwargs['pk_post_fav']}))
 
@@ -267,9 +334,7 @@ class PostFavouritesShowAll(PermissionRequiredMixin, ListView):
     def get_queryset(self):
         post_qs = Post.objects.select_related('author').select_related('category').filter(
             Q(favourites=self.request.user))
-        post_qs = post_qs.filter(Q(is_privat=False) | Q(author=self.request.user)).annotate(
-            is_like=Exists(Post.objects.filter(pk=OuterRef('pk'), likes=self.request.user))
-        )
+        post_qs = post_qs.filter(Q(is_privat=False) | Q(author=self.request.user))
         return post_qs
 
     def get_context_data(self, **kwargs):
@@ -279,63 +344,38 @@ class PostFavouritesShowAll(PermissionRequiredMixin, ListView):
         context['fav_false_text'] = fav_false_text
         context['fav_true_text'] = fav_true_text
         context['category_list'] = Category.objects.filter(level=0)
+        page = context['page_obj']
+        page.object_list = mark_user_interactions(page.object_list, self.request.user, (('likes', 'is_like'),))
+        apply_like_buffer(page.object_list, self.request.user)
+        context['posts'] = page.object_list
         return context
 
 
 @login_required
 def like(request):
     if request.POST.get('action') == 'post':
-        like_l = UnLike_text
-        result = ''
         id_odj = int(request.POST.get('postid'))
-        post = get_object_or_404(Post, id=id_odj)
-        if post.likes.filter(id=request.user.id).exists():
-            post.likes.remove(request.user)
-            post.like_count -= 1
-            result = post.like_count
-            post.save()
+        if BLOG_LIKES_WRITE_BEHIND:
+            added, result = toggle_like_buffered(id_odj, request.user)
         else:
-            like_l = like_text
-            post.likes.add(request.user)
-            post.like_count += 1
-            result = post.like_count
-            post.save()
+            added, result = toggle_m2m(Post, id_odj, 'likes', request.user, 'like_count')
+        like_l = like_text if added else UnLike_text
         return JsonResponse({'result': result, 'like': like_l})
 
 
 @login_required
 def favourites(request):
     if request.POST.get('action') == 'post':
-        fav_btn_text = fav_false_text
         id_odj = int(request.POST.get('postid'))
-        post = get_object_or_404(Post.objects, id=id_odj)
-
-        if post.favourites.filter(id=request.user.id).exists():
-            post.favourites.remove(request.user)
-            post.save()
-        else:
-            fav_btn_text = fav_true_text
-            post.favourites.add(request.user)
-            post.save()
+        added, _ = toggle_m2m(Post, id_odj, 'favourites', request.user)
+        fav_btn_text = fav_true_text if added else fav_false_text
         return JsonResponse({'fav_btn_text': fav_btn_text})
 
 
 @login_required
 def like_comment(request):
     if request.POST.get('action') == 'post':
-        like_l = UnLike_text
-        result = ''
         id_odj = int(request.POST.get('commentid'))
-        comment = get_object_or_404(CommentsPost, id=id_odj)
-        if comment.likes.filter(id=request.user.id).exists():
-            comment.likes.remove(request.user)
-            comment.like_count -= 1
-            result = comment.like_count
-            comment.save()
-        else:
-            like_l = like_text
-            comment.likes.add(request.user)
-            comment.like_count += 1
-            result = comment.like_count
-            comment.save()
+        added, result = toggle_m2m(CommentsPost, id_odj, 'likes', request.user, 'like_count')
+        like_l = like_text if added else UnLike_text
         return JsonResponse({'result': result, 'like': like_l})
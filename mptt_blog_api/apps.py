@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MpttBlogApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mptt_blog_api'
+
+    def ready(self):
+        import mptt_blog_api.signals
@@ -0,0 +1,19 @@
+import uuid
+
+from django.core.cache import cache
+
+CATEGORIES_VERSION_KEY = 'mptt_blog_api_categories_version'
+
+
+def new_categories_version():
+    return uuid.uuid4().hex
+
+
+def get_categories_version():
+    # Меняется при любом изменении дерева CategoryBlog, используется в ETag.
+    # Токен случайный: после потери ключа старый ETag не совпадёт с новой версией
+    return cache.get_or_set(CATEGORIES_VERSION_KEY, new_categories_version, None)
+
+
+def invalidate_categories():
+    cache.set(CATEGORIES_VERSION_KEY, new_categories_version(), None)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mptt_blog_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categoryblog',
+            name='url',
+            field=models.TextField(db_index=True, verbose_name='Url адрес'),
+        ),
+    ]
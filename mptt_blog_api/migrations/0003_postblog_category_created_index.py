@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mptt_blog_api', '0002_categoryblog_url_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='postblog',
+            index=models.Index(fields=['category', '-created', '-id'], name='postblog_category_created_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mptt_blog_api', '0004_postblog_public_created_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='postblog',
+            index=models.Index(fields=['-created', '-id'], name='postblog_created_idx'),
+        ),
+    ]
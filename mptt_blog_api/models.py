@@ -1,11 +1,14 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value, Q
+from django.db.models.functions import Concat, Substr
 from mptt.models import MPTTModel, TreeForeignKey
 from django.utils.text import slugify
 from pytils.translit import slugify
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from ckeditor.fields import RichTextField
+from .cache import invalidate_categories
 
 YES = 'True'
 NO = 'False'
@@ -82,6 +85,18 @@ class PostBlog(models.Model):
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Лента категории: keyset-пагинация по (created, id)
+        indexes = [
+            models.Index(fields=['category', '-created', '-id'], name='postblog_category_created_idx'),
+            # Лента ветки категорий (branch_posts_filter): посты по (created, id) с проверкой категории
+            models.Index(fields=['-created', '-id'], name='postblog_created_idx'),
+            # Публичная лента категории (анонимные пользователи): только is_private=False
+            models.Index(
+                fields=['category', '-created', '-id'],
+                condition=Q(is_private=False),
+                name='postblog_public_created_idx'
+            ),
+        ]
 
     def get_absolute_url(self):
         return reverse('mptt_blog_urls:post_detail', kwargs={'slug_cat': self.category.url, 'pk': self.pk})
@@ -93,24 +108,16 @@ def category_author_default(*args, **kwargs):
 
 
 def update_branch_urls(obj, old_url):
-    update_list = []
-    for children in obj.get_descendants(include_self=False):
-        update_list.append(
-            CategoryBlog(
-                id=children.id,
-                url=build_url(children.url, old_url, obj.url)
-            )
-        )
-    CategoryBlog.objects.bulk_update(
-        update_list,
-        fields=['url']
+    # Один UPDATE по диапазону tree_id/lft/rght: у потомков заменяется префикс old_url на obj.url
+    CategoryBlog.objects.filter(
+        tree_id=obj.tree_id,
+        lft__gt=obj.lft,
+        rght__lt=obj.rght
+    ).update(
+        url=Concat(Value(obj.url), Substr('url', len(old_url) + 1), output_field=models.TextField())
     )
 
 
-def build_url(children_url, old_url, obj_url):
-    return children_url.replace(old_url, obj_url, 1)
-
-
 class CategoryBlog(MPTTModel):
     title = models.CharField(
         verbose_name='Название',
@@ -135,8 +142,8 @@ class CategoryBlog(MPTTModel):
         default=category_author_default
     )
     url = models.TextField(
-        verbose_name='Url адрес'
-
+        verbose_name='Url адрес',
+        db_index=True
     )
 
     def save(self, *args, **kwargs):
@@ -148,9 +155,11 @@ class CategoryBlog(MPTTModel):
             update_branch = True
             old_url = self.url
             self.url = self.build_url()
-        super().save(*args, **kwargs)
-        if update_branch:
-            update_branch_urls(self, old_url)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_branch:
+                update_branch_urls(self, old_url)
+        transaction.on_commit(invalidate_categories)
 
     def build_url(self):
         title = slugify(self.title)
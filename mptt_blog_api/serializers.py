@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from mptt_blog.models import Post, User, Category
-from .models import CategoryBlog
+from .models import CategoryBlog, PostBlog
 
 
 class AuthorSerializer(serializers.ModelSerializer):
@@ -18,22 +18,40 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 class PostSerializer(serializers.ModelSerializer):
-    category = CategorySerializer()
-    author = AuthorSerializer()
+    """
+    Post with category and author. Likes and favourites as counts, not user id lists.
+    Queryset: Post.objects.select_related('author', 'category__author'),
+    is_like / is_favour / favourites_count: mark_user_interactions, mark_m2m_counts.
+
+    """
+    category = CategorySerializer(read_only=True)
+    author = AuthorSerializer(read_only=True)
     is_favour = serializers.BooleanField(read_only=True)
     is_like = serializers.BooleanField(read_only=True)
-    favourites = serializers.CharField()
-    likes = serializers.CharField()
+    favourites_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Post
-        fields = '__all__'
+        fields = ('id', 'title', 'content', 'category', 'author', 'is_privat', 'like_count', 'favourites_count',
+                  'comment_count', 'is_like', 'is_favour', 'created', 'updated')
 
 
 class CategoryPostsSerializer(serializers.ModelSerializer):
+    """
+    Post of CategoryPostAPIView list. Likes and favourites as counts, not user id lists.
+    Queryset: PostBlog.objects.select_related('author'),
+    is_like / is_favour / favourites_count: mark_user_interactions, mark_m2m_counts.
+
+    """
+    author = AuthorSerializer(read_only=True)
+    is_favour = serializers.BooleanField(read_only=True)
+    is_like = serializers.BooleanField(read_only=True)
+    favourites_count = serializers.IntegerField(read_only=True)
+
     class Meta:
-        model = Post
-        fields = '__all__'
+        model = PostBlog
+        fields = ('id', 'title', 'text', 'category', 'author', 'is_private', 'like_count', 'favourites_count',
+                  'is_like', 'is_favour', 'created', 'updated')
 
 
 class CategoryCreateUpdateSerializer(serializers.ModelSerializer):
@@ -70,11 +88,18 @@ class CategoryCreateUpdateSerializer(serializers.ModelSerializer):
 
 
 class CategoriesSerializer(serializers.ModelSerializer):
+    # (rght - lft - 1) // 2, без запросов
+    descendant_count = serializers.IntegerField(source='get_descendant_count', read_only=True)
+
     class Meta:
         model = CategoryBlog
-        fields = ('id', 'parent', 'title', 'author')
+        fields = ('id', 'parent', 'title', 'author', 'descendant_count')
 
     def get_fields(self):
         fields = super(CategoriesSerializer, self).get_fields()
-        fields['childrens'] = CategoriesSerializer(many=True, required=False)
+        only = self.context.get('fields')
+        if only:
+            fields = {name: field for name, field in fields.items() if name in only}
+        # get_children() берёт детей из get_cached_trees без запросов
+        fields['childrens'] = CategoriesSerializer(many=True, required=False, source='get_children')
         return fields
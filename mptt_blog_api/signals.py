@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from .models import CategoryBlog
+from .cache import invalidate_categories
+
+
+@receiver(post_delete, sender=CategoryBlog)
+def category_post_delete(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_categories)
+
+
+@receiver(node_moved, sender=CategoryBlog)
+def category_node_moved(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_categories)
@@ -1,3 +1,50 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from .cache import CATEGORIES_VERSION_KEY
+from .models import CategoryBlog, PostBlog
+
+
+class NumericQueryParamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author')
+        cls.category = CategoryBlog.objects.create(title='Python', author=author)
+        PostBlog.objects.create(title='Post', category=cls.category, text='text', author=author)
+
+    def test_depth_superscript_digit_rejected(self):
+        # '²'.isdigit() истинно, но int('²') падает
+        response = self.client.get(reverse('mptt_blog_api:categories-list'), {'depth': '²'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_depth_accepted(self):
+        response = self.client.get(reverse('mptt_blog_api:categories-list'), {'depth': '1'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_no_count_page_superscript_digit_not_found(self):
+        url = reverse('mptt_blog_api:category-posts', kwargs={'id': self.category.id})
+        response = self.client.get(url, {'count': 'false', 'page': '²'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(url, {'count': 'false', 'page': '1'})
+        self.assertEqual(response.status_code, 200)
+
+
+class CategoriesETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = CategoryBlog.objects.create(title='Python', author=User.objects.create(username='author'))
+
+    def test_lost_version_key_does_not_revalidate_old_etag(self):
+        url = reverse('mptt_blog_api:categories-list')
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.title = 'Django'
+            self.category.save()
+        cache.delete(CATEGORIES_VERSION_KEY)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['title'], 'Django')
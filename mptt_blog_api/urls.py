@@ -5,6 +5,8 @@ app_name = 'mptt_blog_api'
 urlpatterns = [
     path('categories', CategoriesAPIView.as_view({'get': 'list'}), name='categories-list'),
     path('category/<int:id>', CategoriesAPIView.as_view({'get': 'list'}), name='category-detail'),
+    path('category/<int:id>/children', CategoriesAPIView.as_view({'get': 'children'}), name='category-children'),
+    path('category/<int:id>/posts', CategoryPostAPIView.as_view({'get': 'list'}), name='category-posts'),
 
     path('category/create', CategoryCreateViewAPI.as_view(), name='category-create'),
     path('category/<int:id>/create', CategoryCreateViewAPI.as_view(), name='category-create'),
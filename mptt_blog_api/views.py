@@ -1,20 +1,29 @@
+import hashlib
+
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.http import quote_etag, parse_etags
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from mptt.utils import get_cached_trees
 from rest_framework.decorators import api_view
 from rest_framework.generics import get_object_or_404 as api404
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
-from mptt_blog.utils import random_posts
-from django.db.models import Q, OuterRef, Exists
+from mptt_blog.utils import random_posts, mark_user_interactions, mark_m2m_counts, branch_posts_filter, \
+    KEYSET_ORDERING
+from django.db.models import Q, OuterRef, Exists, Subquery
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from .serializers import PostSerializer, CategoryPostsSerializer, CategorySerializer, CategoryCreateUpdateSerializer, \
     CategoriesSerializer
 from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.permissions import IsAuthenticated
 from .models import CategoryBlog, PostBlog
+from .cache import get_categories_version
 from .permissions_custom import IsAuthor
 
 
@@ -59,6 +68,13 @@ class CategoriesAPIView(ReadOnlyModelViewSet):
     """
     Get categories all or by id
 
+    The whole forest or one subtree is loaded by one query and serialized from get_cached_trees.
+    Supports ETag / If-None-Match.
+
+    Query params:
+    depth - levels of childrens below the top nodes (default: all)
+    fields - comma separated fields of each node: id, parent, title, author, descendant_count
+
     """
     serializer_class = CategoriesSerializer
     lookup_field = 'id'
@@ -66,12 +82,77 @@ class CategoriesAPIView(ReadOnlyModelViewSet):
     def get_queryset(self):
         return CategoryBlog.objects.all()
 
-    def list(self, request, *args, **kwargs):
+    def get_depth(self):
+        depth = self.request.query_params.get('depth')
+        if depth is None:
+            return None
+        if not depth.isdecimal():
+            raise ValidationError({'depth': 'Must be a non-negative integer'})
+        return int(depth)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        fields = self.request.query_params.get('fields')
+        if fields:
+            fields = set(fields.split(','))
+            unknown = fields - set(CategoriesSerializer.Meta.fields)
+            if unknown:
+                raise ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown))}'})
+            context['fields'] = fields
+        return context
+
+    def get_tree_queryset(self):
+        queryset = self.get_queryset().order_by('tree_id', 'lft')
+        depth = self.get_depth()
         if 'id' in self.kwargs:
-            data = self.get_serializer(self.get_object()).data
-        else:
-            data = self.get_serializer(self.get_queryset(), many=True).data
-        return Response(data, status=status.HTTP_200_OK)
+            # Узел и его потомки по tree_id/lft/rght одним запросом
+            node = CategoryBlog.objects.filter(
+                id=self.kwargs['id'],
+                tree_id=OuterRef('tree_id'),
+                lft__lte=OuterRef('lft'),
+                rght__gte=OuterRef('rght')
+            )
+            if depth is not None:
+                node = node.filter(level__gte=OuterRef('level') - depth)
+            queryset = queryset.filter(Exists(node))
+        elif depth is not None:
+            queryset = queryset.filter(level__lte=depth)
+        return queryset
+
+    def get_etag(self, request):
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return quote_etag(f'{get_categories_version()}-{path}')
+
+    def tree_response(self, request, get_data):
+        etag = self.get_etag(request)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(get_data(), status=status.HTTP_200_OK, headers={'ETag': etag})
+
+    def list(self, request, *args, **kwargs):
+        def get_data():
+            data = self.get_serializer(get_cached_trees(self.get_tree_queryset()), many=True).data
+            if 'id' in self.kwargs:
+                if not data:
+                    raise Http404('No CategoryBlog matches the given query.')
+                data = data[0]
+            return data
+
+        return self.tree_response(request, get_data)
+
+    def children(self, request, *args, **kwargs):
+        """
+        Direct childrens of category, without their subtrees (see descendant_count)
+
+        """
+        def get_data():
+            children = self.get_queryset().filter(parent_id=self.kwargs['id']).order_by('lft')
+            data = self.get_serializer(get_cached_trees(children), many=True).data
+            if not data and not CategoryBlog.objects.filter(id=self.kwargs['id']).exists():
+                raise Http404('No CategoryBlog matches the given query.')
+            return data
+
+        return self.tree_response(request, get_data)
 
 
 class CategoryUpDelViewAPI(generics.RetrieveUpdateDestroyAPIView):
@@ -101,18 +182,7 @@ class CategoryUpDelViewAPI(generics.RetrieveUpdateDestroyAPIView):
 
 
 def update_page_data_like_fav(request, page):
-    if request.user.is_authenticated:
-        post_ids = {x.id: i for i, x in enumerate(page)}
-
-        for post_id in request.user.favourite_posts.filter(
-                id__in=list(post_ids.keys())).values_list('id', flat=True):
-            page[post_ids[post_id]].is_favour = True
-
-        for post_id in request.user.like_posts.filter(
-                id__in=list(post_ids.keys())).values_list('id', flat=True):
-            page[post_ids[post_id]].is_like = True
-
-    return page
+    return mark_user_interactions(page, request.user)
 
 
 class PaginatorCategoryPost(PageNumberPagination):
@@ -121,34 +191,112 @@ class PaginatorCategoryPost(PageNumberPagination):
     max_page_size = 8
 
 
+class NoCountPaginatorCategoryPost(PaginatorCategoryPost):
+    """
+    ?page= without COUNT(*): page_size + 1 rows, has_next by the extra row
+
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        page_number = request.query_params.get(self.page_query_param, '1')
+        if not page_number.isdecimal() or int(page_number) < 1:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message='Invalid page.'))
+        self.page_number = int(page_number)
+
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        if not rows and self.page_number > 1:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message='Empty page.'))
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'has_next': self.has_next,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class CursorPaginatorCategoryPost(CursorPagination):
+    # Keyset по (created, id): без COUNT(*) и OFFSET на глубоких страницах
+    page_size = PaginatorCategoryPost.page_size
+    page_size_query_param = PaginatorCategoryPost.page_size_query_param
+    max_page_size = PaginatorCategoryPost.max_page_size
+    ordering = KEYSET_ORDERING
+
+
 class CategoryPostAPIView(ReadOnlyModelViewSet):
+    """
+    Posts of category, newest first
+
+    ?page= - page number pagination with count
+    ?page=&count=false - page number pagination without COUNT(*)
+    ?cursor= - keyset pagination
+    ?branch=true - posts of category and all its descendants, always keyset
+
+    """
     authentication_classes = [JWTAuthentication]
     serializer_class = CategoryPostsSerializer
+    pagination_class = PaginatorCategoryPost
+    count_query_param = 'count'
+    branch_query_param = 'branch'
+
+    @cached_property
+    def is_branch(self):
+        return self.request.query_params.get(self.branch_query_param) == 'true'
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            query_params = self.request.query_params
+            if CursorPaginatorCategoryPost.cursor_query_param in query_params or self.is_branch:
+                self._paginator = CursorPaginatorCategoryPost()
+            elif query_params.get(self.count_query_param) == 'false':
+                self._paginator = NoCountPaginatorCategoryPost()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
-        category = api404(CategoryBlog, id=self.kwargs['id'])
-        post_qs = PostBlog.objects.select_related('author').filter(Q(category=category))
+        # Категорию отдельно не загружаем: если на странице есть посты, она существует
+        post_qs = PostBlog.objects.select_related('author')
+        if self.is_branch:
+            # Диапазон ветки подзапросами по pk: узел не загружается отдельным запросом
+            node = CategoryBlog.objects.filter(id=self.kwargs['id'])
+            post_qs = post_qs.filter(branch_posts_filter(
+                Subquery(node.values('tree_id')), Subquery(node.values('lft')), Subquery(node.values('rght'))
+            ))
+        else:
+            post_qs = post_qs.filter(category_id=self.kwargs['id'])
         if self.request.user.is_authenticated:
-            post_qs = post_qs.filter(Q(is_privat=False) | Q(author=self.request.user))
+            post_qs = post_qs.filter(Q(is_private=False) | Q(author=self.request.user))
         else:
-            post_qs = post_qs.filter(is_privat=False)
-        queryset = {
-            'post_qs': post_qs,
-            'category': category
-        }
-        return queryset
+            post_qs = post_qs.filter(is_private=False)
+        return post_qs.order_by(*KEYSET_ORDERING)
 
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        page = self.paginate_queryset(queryset['post_qs'])  # Применяем пагинацию
-        if page is not None:
-            # Здесь мы обновляем объекты на текущей странице
-            page = update_page_data_like_fav(request, page)
-
-            serializer = self.get_serializer(page, many=True)
-
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
-        # Если нет пагинации, то просто сериализуем объекты
-        return Response(serializer.data)
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        if not page and not CategoryBlog.objects.filter(id=self.kwargs['id']).exists():
+            raise Http404('No CategoryBlog matches the given query.')
+
+        page = update_page_data_like_fav(request, page)
+        page = mark_m2m_counts(page)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
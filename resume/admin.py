@@ -1,24 +1,36 @@
 from django.contrib import admin
 from django.db.models import Sum
 from mptt_blog import forms
+from redis import RedisError
 from .models import *
+from .cache import count_visit
 
 admin.site.register(MyEducation)
 admin.site.register(AboutMe)
 admin.site.register(EmailSend)
 
 
-# @admin.register(UniqueIP)
-# class AdminUniqueIP(admin.ModelAdmin):
-#     ordering = ['-date']
-#     list_display = ('ip_address', 'date')
-#     list_per_page = 50
-#
-#     def has_add_permission(self, request):
-#         return False
-#
-#     def has_change_permission(self, request, obj=None):
-#         return False
+@admin.register(UniqueIP)
+class AdminUniqueIP(admin.ModelAdmin):
+    ordering = ['-date']
+    list_display = ('ip_address', 'date')
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Redis опрашивается только при открытии списка, а не при импорте модели
+        try:
+            visits_today = count_visit()
+        except RedisError:
+            visits_today = 'нет данных'
+        extra_context = extra_context or {}
+        extra_context['title'] = f'Посетители, сегодня: {visits_today}'
+        return super().changelist_view(request, extra_context)
 
 
 @admin.register(Feedback)
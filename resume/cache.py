@@ -1,57 +1,140 @@
+import time
+import uuid
+
 from django.core.cache import cache
-import redis
-from django.shortcuts import get_object_or_404
+from django.db import models, transaction
+from django.http import Http404
 from django_redis import get_redis_connection
 
-from core.settings import REDIS_HOST as redis_host
+from core.redis_client import get_redis
+from core.settings import RESUME_CACHE_TIMEOUT, RESUME_CACHE_TIMEOUTS, \
+    RESUME_CACHE_LOCK_TIMEOUT
 
-TIME_CACHE = 1
 
-def get_model_all(model):
+def version_key(model_name):
+    return f'{model_name}_version'
+
+
+def related_model_names(model, field):
+    # Модели, от которых зависит выборка по field (stacks__slug -> stack)
+    names = [model._meta.model_name]
+    related_model = model._meta.get_field(field.split('__')[0]).related_model
+    if related_model and related_model._meta.model_name not in names:
+        names.append(related_model._meta.model_name)
+    return names
+
+
+def versioned_key(key, *model_names):
+    # Ключ содержит поколения всех моделей, от которых зависит значение:
+    # инвалидация модели - новый токен поколения, старые ключи просто истекают по TTL
+    keys = [version_key(name) for name in model_names]
+    versions = cache.get_many(keys)
+    missing = [k for k in keys if k not in versions]
+    if missing:
+        # Токен случайный: потерянный ключ версии не вернёт поколение, под которым уже лежат строки
+        for k in missing:
+            cache.add(k, uuid.uuid4().hex, None)
+        versions.update(cache.get_many(missing))
+    generation = '.'.join(str(versions.get(k)) for k in keys)
+    return f'{key}_v{generation}'
+
+
+def cache_rows(queryset):
+    # В кэш кладём только значения полей, а не QuerySet с состоянием ORM
+    fields = [field.attname for field in queryset.model._meta.concrete_fields]
+    return fields, list(queryset.values_list(*fields))
+
+
+def build_objects(model, rows):
+    fields, values = rows
+    return [model.from_db(None, fields, row) for row in values]
+
+
+def find_obj(objects, field, value):
+    for obj in objects:
+        if getattr(obj, field) == value:
+            return obj
+    raise Http404(f'No {field}={value} in cached objects')
+
+
+def cache_timeout(*model_names):
+    return min(RESUME_CACHE_TIMEOUTS.get(name, RESUME_CACHE_TIMEOUT) for name in model_names)
 
-    return cache.get_or_set(f'{model._meta.model_name}_all', model.objects.all(), TIME_CACHE)
+
+def get_or_set_rows(key, get_rows, *model_names):
+    rows = cache.get(key)
+    if rows is not None:
+        return rows
+
+    # Пересчитывает только воркер, взявший lock, остальные ждут его результат
+    lock_key = f'{key}_lock'
+    if cache.add(lock_key, 1, RESUME_CACHE_LOCK_TIMEOUT):
+        try:
+            rows = get_rows()
+            cache.set(key, rows, cache_timeout(*model_names))
+        finally:
+            cache.delete(lock_key)
+        return rows
+
+    deadline = time.monotonic() + RESUME_CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        rows = cache.get(key)
+        if rows is not None:
+            return rows
+    return get_rows()
+
+
+def get_model_all(model):
+    model_name = model._meta.model_name
+    key = versioned_key(f'{model_name}_all', model_name)
+    rows = get_or_set_rows(key, lambda: cache_rows(model.objects.all()), model_name)
+    return build_objects(model, rows)
 
 
 def get_model_all_order(model, order):
-    return cache.get_or_set(f'{model._meta.model_name}_all_order{order}', model.objects.all().order_by(order), TIME_CACHE)
+    model_name = model._meta.model_name
+    key = versioned_key(f'{model_name}_all_order{order}', model_name)
+    rows = get_or_set_rows(key, lambda: cache_rows(model.objects.all().order_by(order)), model_name)
+    return build_objects(model, rows)
 
 
-def get_single_model_obj(model, field, value):
-    cache_key = cache.get_or_set(f'{model._meta.model_name}_get_{field}', {}, TIME_CACHE)
+def lookup_value(value):
+    return value.pk if isinstance(value, models.Model) else value
 
-    if cache_key.get(value) is None:
-        kwargs = {field: value}
-        new_obj = get_object_or_404(model, **kwargs)
-        cache_key[value] = new_obj
-        cache.set(f'{model._meta.model_name}_get_{field}', cache_key)
-    return cache_key.get(value)
+
+def get_single_model_obj(model, field, value):
+    # Каждое значение хранится под своим ключом
+    model_name = model._meta.model_name
+    key = versioned_key(f'{model_name}_get_{field}_{lookup_value(value)}', model_name)
+    rows = get_or_set_rows(key, lambda: cache_rows(model.objects.filter(**{field: value})), model_name)
+    if not rows[1]:
+        raise Http404(f'No {model._meta.object_name} matches the given query.')
+    return build_objects(model, rows)[0]
 
 
 def get_filter_model(model, field, value):
-    cache_key = cache.get_or_set(f'{model._meta.model_name}_filter_{field}', {}, TIME_CACHE)
-    if cache_key.get(value) is None:
-        kwargs = {field: value}
-        new_obj = model.objects.filter(**kwargs)
-        cache_key[value] = new_obj
-        cache.set(f'{model._meta.model_name}_filter_{field}', cache_key)
-    return cache_key.get(value)
+    model_names = related_model_names(model, field)
+    key = versioned_key(f'{model._meta.model_name}_filter_{field}_{lookup_value(value)}', *model_names)
+    rows = get_or_set_rows(key, lambda: cache_rows(model.objects.filter(**{field: value})), *model_names)
+    return build_objects(model, rows)
 
 
 def get_mtm_all(model, field, value):
-    cache_key = cache.get_or_set(f'{model._meta.model_name}_mtm_{field}', {}, TIME_CACHE)
-    if cache_key.get(value.id) is None:
-        new_obj = getattr(value, f'{field}').all()
-        cache_key[value.id] = new_obj
-        cache.set(f'{model._meta.model_name}_mtm_{field}', cache_key)
-    return cache_key.get(value.id)
+    model_names = related_model_names(model, field)
+    key = versioned_key(f'{model._meta.model_name}_mtm_{field}_{value.id}', *model_names)
+    rows = get_or_set_rows(key, lambda: cache_rows(getattr(value, field).all()), *model_names)
+    related_model = model._meta.get_field(field).related_model
+    return build_objects(related_model, rows)
 
 
 def delete_cache(model):
-    redis_client = redis.Redis(host=redis_host, port=6379, db=1, charset="utf-8", decode_responses=True)
-    keys = redis_client.keys('*')
-    for key in keys:
-        if model in key:
-            redis_client.delete(key)
+    cache.set(version_key(model), uuid.uuid4().hex, None)
+
+
+def delete_cache_on_commit(model):
+    # Новое поколение только после commit: иначе читатель закеширует старые строки под новым ключом
+    transaction.on_commit(lambda: delete_cache(model))
 
 
 def count_send_email(ip):
@@ -73,6 +156,8 @@ def del_ip_all():
     cache.delete('ip_data')
 
 
+VISIT_INFO_FIELD = 'info_client'
+
+
 def count_visit():
-    db2 = redis.Redis(host=redis_host, port=6379, db=2, decode_responses=True)
-    return db2.dbsize()
+    return get_redis('visits').dbsize()
@@ -1,14 +1,13 @@
 from datetime import datetime
 
 from core.settings import USE_HTTPS, ALLOWED_HOSTS
-from .cache import count_visit
 from django.db import models
 from django.db.models import Sum, Count
 from django.urls import reverse
 from django.utils.text import slugify
 from pytils.translit import slugify
 from ckeditor.fields import RichTextField
-from .cache import delete_cache
+from .cache import delete_cache_on_commit
 from PIL import Image
 
 CHOICE_STATUS = [
@@ -38,7 +37,7 @@ class MyEducation(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        delete_cache(self._meta.model_name)
+        delete_cache_on_commit(self._meta.model_name)
 
 
 class AboutMe(models.Model):
@@ -56,7 +55,7 @@ class AboutMe(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        delete_cache(self._meta.model_name)
+        delete_cache_on_commit(self._meta.model_name)
 
     def __str__(self):
         return f'{self.name}'
@@ -78,7 +77,7 @@ class Stack(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        delete_cache(self._meta.model_name)
+        delete_cache_on_commit(self._meta.model_name)
 
 
 class Project(models.Model):
@@ -130,13 +129,13 @@ class Project(models.Model):
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
         super().save(*args, **kwargs)
-        delete_cache(self._meta.model_name)
         if self.image:
             image = Image.open(self.image.path)
             if image.height > 270 or image.width > 270:
                 resize = (270, 270)
                 image.thumbnail(resize)
                 image.save(self.image.path)
+        delete_cache_on_commit(self._meta.model_name)
 
 
 class EmailSend(models.Model):
@@ -162,7 +161,7 @@ class CardProject(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        delete_cache(self._meta.model_name)
+        delete_cache_on_commit(self._meta.model_name)
 
 
 class EmailSettings(models.Model):
@@ -193,7 +192,7 @@ class UniqueIP(models.Model):
 
     class Meta:
         verbose_name = "Посетитель"
-        verbose_name_plural = f"Посетители {count_visit()}"
+        verbose_name_plural = "Посетители"
 
     def __str__(self):
         return f'{self.ip_address}  //  {self.date}  //'
@@ -1,31 +1,39 @@
-from django.db.models.signals import post_migrate, post_delete
+from django.db.models.signals import post_migrate, post_delete, m2m_changed
 from django.dispatch import receiver
 from .models import *
-from .cache import delete_cache
+from .cache import delete_cache_on_commit
 from django.core.exceptions import AppRegistryNotReady
 from django.apps import apps
 
 
 @receiver(post_delete, sender=MyEducation)
 def education_post_delete(sender, instance, **kwargs):
-    delete_cache(sender._meta.model_name)
+    delete_cache_on_commit(sender._meta.model_name)
 
 
 @receiver(post_delete, sender=AboutMe)
 def education_post_delete(sender, instance, **kwargs):
-    delete_cache(sender._meta.model_name)
+    delete_cache_on_commit(sender._meta.model_name)
 
 
 @receiver(post_delete, sender=Stack)
 def education_post_delete(sender, instance, **kwargs):
-    delete_cache(sender._meta.model_name)
+    delete_cache_on_commit(sender._meta.model_name)
 
 
 @receiver(post_delete, sender=Project)
 def education_post_delete(sender, instance, **kwargs):
-    delete_cache(sender._meta.model_name)
+    delete_cache_on_commit(sender._meta.model_name)
 
 
 @receiver(post_delete, sender=CardProject)
 def education_post_delete(sender, instance, **kwargs):
-    delete_cache(sender._meta.model_name)
+    delete_cache_on_commit(sender._meta.model_name)
+
+
+@receiver(m2m_changed, sender=Project.stacks.through)
+def project_stacks_changed(sender, action, **kwargs):
+    # Кеш связей проект <-> технологии хранится под версиями обеих моделей
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        delete_cache_on_commit(Project._meta.model_name)
+        delete_cache_on_commit(Stack._meta.model_name)
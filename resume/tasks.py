@@ -34,24 +34,46 @@ def del_ip_all_task():
 
 @shared_task
 def create_visit_task():
-    import redis
-    import json
+    from core.redis_client import get_redis
+    from core.settings import REDIS_VISITS_DB, REDIS_VISITS_SNAPSHOT_DB, VISITS_BATCH_SIZE
+    snapshot = get_redis('visits_snapshot')
+
+    # SWAPDB атомарно отдаёт накопленные визиты в snapshot, новые визиты пишутся в пустую базу.
+    # Если snapshot не пуст - прошлый запуск не закончился, сначала дочитываем его.
+    if not snapshot.dbsize():
+        snapshot.swapdb(REDIS_VISITS_DB, REDIS_VISITS_SNAPSHOT_DB)
+
+    created = 0
+    keys = []
+    for key in snapshot.scan_iter(count=VISITS_BATCH_SIZE):
+        keys.append(key)
+        if len(keys) >= VISITS_BATCH_SIZE:
+            created += create_visit_batch(snapshot, keys)
+            keys = []
+    if keys:
+        created += create_visit_batch(snapshot, keys)
+    return created
+
+
+def create_visit_batch(snapshot, keys):
     from .models import UniqueIP
-    db2 = redis.Redis(host='localhost', port=6379, db=2, decode_responses=True)
-    all_keys = db2.keys()
+    from .cache import VISIT_INFO_FIELD
+    pipe = snapshot.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
     create_list = []
-    if all_keys:
-        for key in all_keys:
-            val = json.loads(db2.get(key))
-            create_list.append(
-                UniqueIP(
-                    ip_address=key,
-                    path_client=val['path_client'],
-                    info_client=val['info_client'],
-                )
+    for key, val in zip(keys, pipe.execute()):
+        if not val:
+            continue
+        info_client = val.pop(VISIT_INFO_FIELD, 'Нет информации')
+        create_list.append(
+            UniqueIP(
+                ip_address=key,
+                path_client={path: int(count) for path, count in val.items()},
+                info_client=info_client,
             )
-        UniqueIP.objects.bulk_create(
-            create_list
         )
-        db2.flushdb()
-    print('ww')
+    UniqueIP.objects.bulk_create(create_list)
+    # Ключи удаляются только после записи пачки в БД
+    snapshot.delete(*keys)
+    return len(create_list)
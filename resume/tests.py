@@ -1,3 +1,109 @@
+import json
+from unittest import mock
+
+import fakeredis
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from core.settings import REDIS_DATABASES
+from .cache import get_mtm_all, get_filter_model, get_model_all, version_key, VISIT_INFO_FIELD
+from .models import Project, Stack, UniqueIP
+from .tasks import create_visit_task
+
+
+class ResumeCacheInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.django = Stack.objects.create(name='Django', slug='django')
+            self.redis = Stack.objects.create(name='Redis', slug='redis')
+            self.project = Project.objects.create(name='Blog', about='about', image=None)
+            self.project.stacks.add(self.django)
+
+    def test_stacks_change_invalidates_project_and_stack(self):
+        self.assertEqual([s.slug for s in get_mtm_all(Project, 'stacks', self.project)], ['django'])
+        self.assertEqual(get_filter_model(Project, 'stacks__slug', 'redis'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.stacks.add(self.redis)
+
+        self.assertEqual(sorted(s.slug for s in get_mtm_all(Project, 'stacks', self.project)), ['django', 'redis'])
+        self.assertEqual([p.id for p in get_filter_model(Project, 'stacks__slug', 'redis')], [self.project.id])
+
+    def test_version_bumped_only_on_commit(self):
+        get_model_all(Stack)
+        version = cache.get(version_key('stack'))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Stack.objects.create(name='Celery', slug='celery')
+            self.assertEqual(cache.get(version_key('stack')), version)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(version_key('stack')), version)
+        self.assertIn('celery', [s.slug for s in get_model_all(Stack)])
+
+    def test_lost_version_key_does_not_serve_old_rows(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            Stack.objects.create(name='Python', slug='python')
+        get_model_all(Stack)
+        # Версия вытеснена: новое поколение не должно совпасть с тем, под которым лежат строки
+        cache.delete(version_key('stack'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Stack.objects.create(name='Celery', slug='celery')
+
+        self.assertIn('celery', [s.slug for s in get_model_all(Stack)])
+
+
+class CreateVisitTaskTests(TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.redis = {
+            name: fakeredis.FakeRedis(server=server, db=db, decode_responses=True)
+            for name, db in REDIS_DATABASES.items()
+        }
+        patcher = mock.patch('core.redis_client.get_redis', side_effect=self.redis.__getitem__)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def seed(self, db, ip, paths, info):
+        for path in paths:
+            db.hincrby(ip, path)
+        db.hset(ip, VISIT_INFO_FIELD, json.dumps(info))
+
+    def visits(self):
+        return {
+            v.ip_address: (v.path_client, json.loads(v.info_client))
+            for v in UniqueIP.objects.all()
+        }
+
+    def test_visits_moved_to_db(self):
+        visits = self.redis['visits']
+        self.seed(visits, '10.0.0.1', ['/', '/', '/blog/'], {'browser': 'Firefox'})
+        self.seed(visits, '10.0.0.2', ['/resume/'], {'browser': 'Chrome'})
+
+        self.assertEqual(create_visit_task(), 2)
+
+        self.assertEqual(UniqueIP.objects.count(), 2)
+        self.assertEqual(self.visits(), {
+            '10.0.0.1': ({'/': 2, '/blog/': 1}, {'browser': 'Firefox'}),
+            '10.0.0.2': ({'/resume/': 1}, {'browser': 'Chrome'}),
+        })
+        self.assertEqual(self.redis['visits_snapshot'].dbsize(), 0)
+        self.assertEqual(visits.dbsize(), 0)
+
+    def test_interrupted_snapshot_resumed_before_swap(self):
+        # Snapshot остался от упавшего запуска: дочитываем его, свежие визиты ждут следующего запуска
+        self.seed(self.redis['visits_snapshot'], '10.0.0.1', ['/'], {'browser': 'Firefox'})
+        self.seed(self.redis['visits'], '10.0.0.2', ['/blog/'], {'browser': 'Chrome'})
+
+        self.assertEqual(create_visit_task(), 1)
+
+        self.assertEqual(self.visits(), {'10.0.0.1': ({'/': 1}, {'browser': 'Firefox'})})
+        self.assertEqual(self.redis['visits_snapshot'].dbsize(), 0)
+        self.assertEqual(self.redis['visits'].dbsize(), 1)
+
+        self.assertEqual(create_visit_task(), 1)
+        self.assertEqual(self.visits()['10.0.0.2'], ({'/blog/': 1}, {'browser': 'Chrome'}))
@@ -1,7 +1,7 @@
 from django.utils.safestring import mark_safe
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
 from .cache import get_model_all, get_single_model_obj, get_filter_model, get_mtm_all, count_send_email, \
-    get_model_all_order
+    get_model_all_order, find_obj
 from .models import AboutMe, MyEducation, Stack, Project, CardProject
 from django.views.generic import ListView
 from .forms import EmailSendForm, FeedbackForm
@@ -143,7 +143,7 @@ class ProjectDetailView(ListView):
 
         if self.kwargs.get('stack_slug'):
             projects = get_filter_model(Project, 'stacks__slug', self.kwargs['stack_slug'])
-            project = get_object_or_404(projects, slug=self.kwargs['project_slug'])
+            project = find_obj(projects, 'slug', self.kwargs['project_slug'])
         else:
             project = get_single_model_obj(Project, 'slug', self.kwargs['project_slug'])
 
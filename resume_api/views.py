@@ -1,6 +1,5 @@
 from datetime import date
 from django.http import Http404, HttpResponse
-from django.shortcuts import get_object_or_404
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import api_view
@@ -9,7 +8,7 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from resume.cache import get_model_all, get_single_model_obj, get_filter_model, get_model_all_order, \
-    get_mtm_all
+    get_mtm_all, find_obj
 from resume.models import AboutMe, MyEducation, Stack, Project, CardProject
 from user_app.user_session import UserSessionToDo
 from .serializers import AboutMeSerializer, MyEducationSerializer, StackSerializer, FeedbackSerializer, \
@@ -275,7 +274,7 @@ class ProjectDetailAPIReadOnly(ReadOnlyModelViewSet):
         projects = get_filter_model(Project, 'stacks__slug', self.kwargs['stack_slug'])
 
         try:
-            project = get_object_or_404(projects, slug=self.kwargs['project_slug'])
+            project = find_obj(projects, 'slug', self.kwargs['project_slug'])
         except Http404:
             return HttpResponse(f'Project with slug "{self.kwargs["project_slug"]}" '
                                 f'not found in technology with slug "{self.kwargs["stack_slug"]}"', status=404)